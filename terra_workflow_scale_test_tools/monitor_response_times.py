@@ -1,23 +1,30 @@
 import argparse
+import atexit
 import csv
 import functools
+import itertools
 import json
 import logging
 import os
 import psutil
+import signal
 import threading
 import time
 
 from abc import ABC, abstractmethod
+from concurrent import futures
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime
 from enum import Enum
 from pathlib import Path
-from threading import Thread
 from typing import Tuple, Optional, Any
 
 import requests
 import schedule
+from requests.adapters import HTTPAdapter
+
+from terra_workflow_scale_test_tools.terra_auth import get_terra_user_token
 
 
 class DeploymentInfo:
@@ -152,48 +159,90 @@ class DeploymentInfo:
 
 
 class MonitoringUtilityMethods:
+    # A single pooled session shared by all reporters, so that keep-alive connections
+    # to the monitored hosts are reused across scheduled runs rather than paying for a
+    # new TCP+TLS handshake on every request.
+    # Retries are intentionally not enabled: failed responses (e.g. 502) are part of
+    # what is being monitored and must be recorded as-is.
+    # requests uses HTTP/1.1, as do the Terra services' own clients, so concurrent requests
+    # to the same host each use their own pooled connection. pool_maxsize is sized to cover
+    # the concurrent scheduled jobs plus the concurrent DRS flow requests.
+    _session = requests.Session()
+    # (connect, read) timeouts, so that a stalled service cannot block a job indefinitely.
+    # A job run makes at most two sequential requests, so with these timeouts a stalled
+    # run completes within the termination wait of stop_monitoring_background_process().
+    _http_timeout = (5.0, 15.0)
+    _http_adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16)
+    _session.mount("https://", _http_adapter)
+    _session.mount("http://", _http_adapter)
+
+    # Headers common to all requests. The connection is explicitly kept alive for reuse.
+    _base_headers = {
+        'content-type': "application/json",
+        'connection': "keep-alive"
+    }
+
+    METRIC_NAMES = ('start_time', 'response_duration', 'response_code', 'response_reason')
+    _metric_name_set = frozenset(METRIC_NAMES)
+
     def __init__(self):
         super().__init__()
 
+    @classmethod
+    def get_csv_fieldnames(cls, operation_names: Tuple[str, ...]) -> Tuple[str, ...]:
+        return tuple(sorted(f"{operation_name}.{metric}"
+                            for operation_name, metric in itertools.product(operation_names, cls.METRIC_NAMES)))
+
     @staticmethod
     def format_timestamp_as_utc(seconds_since_epoch: float):
-        return datetime.fromtimestamp(seconds_since_epoch, timezone.utc).strftime("%Y/%m/%d %H:%M:%S")
+        return time.strftime("%Y/%m/%d %H:%M:%S", time.gmtime(seconds_since_epoch))
 
     @staticmethod
-    def monitoring_info(start_time: float, response: requests.Response):
-        response_duration = round(time.time() - start_time, 3)
+    def monitoring_info(start_time: float, start_monotonic: float, response: requests.Response):
+        # The wall clock start time is reported, while the duration is measured with the
+        # monotonic clock so that it is unaffected by system clock adjustments.
+        response_duration = round(time.monotonic() - start_monotonic, 3)
         response_code = response.status_code
         response_reason = response.reason
         return dict(start_time=start_time, response_duration=response_duration,
                     response_code=response_code, response_reason=response_reason)
 
+    def send_request(self, method: str, url: str, **kwargs) -> Tuple[Optional[requests.Response], dict]:
+        start_time = time.time()
+        start_monotonic = time.monotonic()
+        try:
+            resp = self._session.request(method, url, timeout=self._http_timeout, **kwargs)
+        except requests.exceptions.Timeout:
+            # Record the timeout as a failed response, so the measurement still appears in the output
+            logger.warning(f"Request timed out: {method} {url}")
+            return None, dict(start_time=start_time,
+                              response_duration=round(time.monotonic() - start_monotonic, 3),
+                              response_code=None, response_reason="timeout")
+        mon_info = self.monitoring_info(start_time, start_monotonic, resp)
+        logger.debug("Request URL: %s", resp.request.url)
+        return resp, mon_info
+
+    @staticmethod
+    def get_response_json(response: Optional[requests.Response]) -> Optional[dict]:
+        if response is None:
+            return None
+        if not response.ok:
+            logger.warning(f"Request failed: {response.status_code} {response.reason}: {response.request.url}")
+            return None
+        # Parse the raw bytes directly, which skips the response text encoding detection.
+        return json.loads(response.content)
+
     def flatten_monitoring_info_dict(self, monitoring_info_dict: dict) -> dict:
-        flattened = dict()
-        for operation_name, mon_info in monitoring_info_dict.items():
-            for metric, value in mon_info.items():
-                if metric in ['start_time', 'response_duration', 'response_code', 'response_reason']:
-                    if metric == 'start_time' and type(value) == float:
-                        value = self.format_timestamp_as_utc(value)
-                    flattened[f"{operation_name}.{metric}"] = value
-        return flattened
+        return {f"{operation_name}.{metric}": self.format_timestamp_as_utc(value) if metric == 'start_time' else value
+                for operation_name, mon_info in monitoring_info_dict.items()
+                for metric, value in mon_info.items()
+                if metric in self._metric_name_set}
 
     @staticmethod
     def get_output_filepath(output_filename: str):
         global output_dir
         return os.path.join(output_dir, output_filename)
 
-    def write_monitoring_info_to_csv(self, monitoring_info_dict: dict, output_filename: str) -> None:
-        output_filename = self.get_output_filepath(output_filename)
-        write_header = False if Path(output_filename).exists() else True
-
-        row_info = self.flatten_monitoring_info_dict(monitoring_info_dict)
-        with open(output_filename, 'a', newline='') as csvfile:
-            fieldnames = sorted(row_info.keys())
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            if write_header:
-                writer.writeheader()
-            writer.writerow(row_info)
-
 
 class TerraMethods(MonitoringUtilityMethods):
     def __init__(self):
@@ -202,82 +251,57 @@ class TerraMethods(MonitoringUtilityMethods):
         self._gen3_info = DeploymentInfo.gen3_factory()
 
     # When run in Terra, this returns the Terra user pet SA token
-    @staticmethod
-    def get_terra_user_pet_sa_token() -> str:
-        import google.auth.transport.requests
-        creds, projects = google.auth.default()
-        creds.refresh(google.auth.transport.requests.Request())
-        token = creds.token
-        return token
+    @classmethod
+    def get_terra_user_pet_sa_token(cls) -> str:
+        return get_terra_user_token(cls._session)
 
     def get_external_identity_link_url_from_bond(self) -> Tuple[str, dict]:
-        headers = {
-            'content-type': "*/*"
-        }
-        start_time = time.time()
-        resp = requests.options(
+        headers = {**self._base_headers, 'content-type': "*/*"}
+        resp, mon_info = self.send_request(
+            "OPTIONS",
             f"https://{self._terra_info.bond_host}/api/link/v1/{self._terra_info.bond_provider}/authorization-url?scopes=openid&scopes=google_credentials&scopes=data&scopes=user&redirect_uri=https://app.terra.bio/#fence-callback&state=eyJwcm92aWRlciI6ImZlbmNlIn0=",
             headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        link_url = resp.url if resp.ok else None
-        return link_url, self.monitoring_info(start_time, resp)
+        link_url = resp.url if resp is not None and resp.ok else None
+        return link_url, mon_info
 
     def get_external_identity_status_from_bond(self, terra_user_token: str) -> Tuple[dict, dict]:
-        headers = {
-            'authorization': f"Bearer {terra_user_token}",
-            'content-type': "application/json"
-        }
-        start_time = time.time()
-        resp = requests.get(f"https://{self._terra_info.bond_host}/api/link/v1/{self._terra_info.bond_provider}",
-                            headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        resp_json = resp.json() if resp.ok else None
-        return resp_json, self.monitoring_info(start_time, resp)
+        headers = {**self._base_headers, 'authorization': f"Bearer {terra_user_token}"}
+        resp, mon_info = self.send_request("GET", f"https://{self._terra_info.bond_host}/api/link/v1/{self._terra_info.bond_provider}",
+                                           headers=headers)
+        resp_json = self.get_response_json(resp)
+        return resp_json, mon_info
 
     def get_fence_token_from_bond(self, terra_user_token: str) -> Tuple[str, dict]:
-        headers = {
-            'authorization': f"Bearer {terra_user_token}",
-            'content-type': "application/json"
-        }
-        start_time = time.time()
-        resp = requests.get(
+        headers = {**self._base_headers, 'authorization': f"Bearer {terra_user_token}"}
+        resp, mon_info = self.send_request(
+            "GET",
             f"https://{self._terra_info.bond_host}/api/link/v1/{self._terra_info.bond_provider}/accesstoken",
             headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        token = resp.json().get('token') if resp.ok else None
-        return token, self.monitoring_info(start_time, resp)
+        token = (self.get_response_json(resp) or {}).get('token')
+        return token, mon_info
 
     def get_service_account_key_from_bond(self, terra_user_token: str) -> Tuple[dict, dict]:
-        headers = {
-            'authorization': f"Bearer {terra_user_token}",
-            'content-type': "application/json"
-        }
-        start_time = time.time()
-        resp = requests.get(
+        headers = {**self._base_headers, 'authorization': f"Bearer {terra_user_token}"}
+        resp, mon_info = self.send_request(
+            "GET",
             f"https://{self._terra_info.bond_host}/api/link/v1/{self._terra_info.bond_provider}/serviceaccount/key",
             headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        sa_key = resp.json().get('data') if resp.ok else None
-        return sa_key, self.monitoring_info(start_time, resp)
+        sa_key = (self.get_response_json(resp) or {}).get('data')
+        return sa_key, mon_info
 
     def get_martha_drs_response(self, terra_user_token: str, drs_uri: str = None) -> Tuple[dict, dict]:
         if drs_uri is None:
             drs_uri = self._gen3_info.public_drs_uri
 
-        headers = {
-            'authorization': f"Bearer {terra_user_token}",
-            'content-type': "application/json"
-        }
+        headers = {**self._base_headers, 'authorization': f"Bearer {terra_user_token}"}
 
         # Request the same fields as the Terra workflow DRS Localizer does.
         data = json.dumps(dict(url=drs_uri, fields=['gsUri', 'googleServiceAccount', 'accessUrl', 'hashes']))
 
-        start_time = time.time()
-        resp = requests.post(f"https://{self._terra_info.martha_host}/martha_v3/",
-                             headers=headers, data=data)
-        logger.debug(f"Request URL: {resp.request.url}")
-        resp_json = resp.json() if resp.ok else None
-        return resp_json, self.monitoring_info(start_time, resp)
+        resp, mon_info = self.send_request("POST", f"https://{self._terra_info.martha_host}/martha_v3/",
+                                           headers=headers, data=data)
+        resp_json = self.get_response_json(resp)
+        return resp_json, mon_info
 
 
 class Gen3Methods(MonitoringUtilityMethods):
@@ -292,16 +316,12 @@ class Gen3Methods(MonitoringUtilityMethods):
         assert drs_uri.startswith("drs://")
         object_id = drs_uri.split(":")[-1]
 
-        headers = {
-            'content-type': "application/json"
-        }
+        headers = {**self._base_headers}
 
-        start_time = time.time()
-        resp = requests.get(f"https://{self.gen3_info.gen3_host}/ga4gh/drs/v1/objects/{object_id}",
-                            headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        resp_json = resp.json() if resp.ok else None
-        return resp_json, self.monitoring_info(start_time, resp)
+        resp, mon_info = self.send_request("GET", f"https://{self.gen3_info.gen3_host}/ga4gh/drs/v1/objects/{object_id}",
+                                           headers=headers)
+        resp_json = self.get_response_json(resp)
+        return resp_json, mon_info
 
     @staticmethod
     def _get_drs_access_id(drs_response: dict, cloud_uri_scheme: str) -> Optional[Any]:
@@ -319,68 +339,87 @@ class Gen3Methods(MonitoringUtilityMethods):
         assert drs_uri.startswith("drs://")
         object_id = drs_uri.split(":")[-1]
 
-        headers = {
-            'authorization': f"Bearer {fence_user_token}",
-            'content-type': "application/json"
-        }
+        headers = {**self._base_headers, 'authorization': f"Bearer {fence_user_token}"}
 
-        start_time = time.time()
-        resp = requests.get(f"https://{self.gen3_info.gen3_host}/ga4gh/drs/v1/objects/{object_id}/access/{access_id}",
-                            headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        access_url = resp.json().get('url') if resp.ok else None
-        return access_url, self.monitoring_info(start_time, resp)
+        resp, mon_info = self.send_request("GET", f"https://{self.gen3_info.gen3_host}/ga4gh/drs/v1/objects/{object_id}/access/{access_id}",
+                                           headers=headers)
+        access_url = (self.get_response_json(resp) or {}).get('url')
+        return access_url, mon_info
 
     def get_fence_userinfo(self, fence_user_token: str):
-        headers = {
-            'authorization': f"Bearer {fence_user_token}",
-            'content-type': "application/json",
-            'accept': '*/*'
-        }
+        headers = {**self._base_headers, 'authorization': f"Bearer {fence_user_token}", 'accept': '*/*'}
 
-        start_time = time.time()
-        resp = requests.get(f"https://{self.gen3_info.gen3_host}/user/user/", headers=headers)
-        logger.debug(f"Request URL: {resp.request.url}")
-        resp_json = resp.json() if resp.ok else None
-        return resp_json, self.monitoring_info(start_time, resp)
+        resp, mon_info = self.send_request("GET", f"https://{self.gen3_info.gen3_host}/user/user/", headers=headers)
+        resp_json = self.get_response_json(resp)
+        return resp_json, mon_info
 
 
 class Scheduler:
+    # Scheduled jobs are run on a fixed pool of reusable worker threads
+    # rather than starting a new thread for each job run.
+    max_job_workers = 4
+    # How long stop_monitoring() waits for in-progress job runs before returning.
+    # Runs still in progress are not interrupted, and the worker threads are joined
+    # at interpreter exit, so process exit is bounded by the request timeouts
+    # (MonitoringUtilityMethods._http_timeout) rather than by this.
+    stop_timeout_seconds = 30
+
     def __init__(self):
         super().__init__()
         self.stop_run_continuously = None
-
-    @staticmethod
-    def run_continuously(interval=1):
-        """Continuously run, while executing pending jobs at each
-        elapsed time interval.
+        self._schedule_thread = None
+        # Each instance has its own jobs, so that stopping one does not leave
+        # its jobs behind in the `schedule` module's default scheduler.
+        self._scheduler = schedule.Scheduler()
+        self._job_executor = ThreadPoolExecutor(max_workers=self.max_job_workers, thread_name_prefix="Job")
+        self._job_futures = dict()
+
+    def run_continuously(self, interval=1):
+        """Continuously run, sleeping until the next job is due and
+        then executing the pending jobs.
+        @param interval: seconds to wait before checking again when
+        no jobs are scheduled.
         @return cease_continuous_run: threading. Event which can
-        be set to cease continuous run. Please note that it is
+        be set to cease continuous run. Setting it also ends the
+        current wait immediately. Please note that it is
         *intended behavior that run_continuously() does not run
-        missed jobs*. For example, if you've registered a job that
-        should run every minute, and you set a continuous run
-        interval of one hour then your job won't be run 60 times
-        at each interval but only once.
+        missed jobs*. For example, if a job runs for longer than its
+        schedule interval, the runs it missed are not made up
+        afterwards; it is run only once when next due.
         """
         cease_continuous_run = threading.Event()
+        scheduler = self._scheduler
 
         class ScheduleThread(threading.Thread):
             def __init__(self):
-                super().__init__()
+                # A daemon thread, so that the process can exit (and run its atexit
+                # handlers) even if monitoring was never stopped.
+                super().__init__(daemon=True)
 
             def run(self):
                 while not cease_continuous_run.is_set():
-                    schedule.run_pending()
-                    time.sleep(interval)
-
-        continuous_thread = ScheduleThread()
-        continuous_thread.start()
+                    scheduler.run_pending()
+                    # Sleep until the next job is due, or until stopped.
+                    # When no jobs are scheduled, check again after `interval` seconds.
+                    idle_seconds = scheduler.idle_seconds
+                    cease_continuous_run.wait(timeout=max(0.0, idle_seconds if idle_seconds is not None else interval))
+
+        self._schedule_thread = ScheduleThread()
+        self._schedule_thread.start()
         return cease_continuous_run
 
-    @staticmethod
-    def run_threaded(job_func):
-        job_thread = Thread(target=job_func)
-        job_thread.start()
+    def run_threaded(self, job_func):
+        # Run at most one instance of each job at a time, so that a stalled job
+        # cannot occupy all the workers and delay the other jobs.
+        previous_future = self._job_futures.get(job_func)
+        if previous_future is not None and not previous_future.done():
+            logger.warning(f"Skipping {job_func.__name__}: the previous run is still in progress")
+            return
+        try:
+            self._job_futures[job_func] = self._job_executor.submit(job_func)
+        except RuntimeError:
+            # The executor has been shut down by stop_monitoring()
+            logger.warning(f"Not running {job_func.__name__}: monitoring has been stopped")
 
     def start_monitoring(self):
         logger.info("Starting background response time monitoring")
@@ -389,6 +428,15 @@ class Scheduler:
     def stop_monitoring(self):
         logger.info("Stopping background response time monitoring")
         self.stop_run_continuously.set()
+        # Wait for the scheduler to stop submitting jobs, then remove them
+        self._schedule_thread.join()
+        self._scheduler.clear()
+        # Return after waiting a limited time for any in-progress job runs to complete,
+        # rather than indefinitely for a run that is stalled on an unresponsive service.
+        self._job_executor.shutdown(wait=False)
+        done, not_done = futures.wait(list(self._job_futures.values()), timeout=self.stop_timeout_seconds)
+        if not_done:
+            logger.warning(f"Stopped with {len(not_done)} job run(s) still in progress")
 
 
 def catch_exceptions(cancel_on_failure=False):
@@ -414,52 +462,141 @@ class ResponseTimeMonitor(Scheduler):
 
     def __init__(self):
         super().__init__()
+        self.drs_flow_reporter = self.DrsFlowResponseTimeReporter("drs_flow_response_times.csv")
+        self.martha_reporter = self.MarthaResponseTimeReporter("martha_response_time.csv")
+        self.bond_external_identity_reporter = \
+            self.BondExternalIdentityResponseTimeReporter("bond_external_idenity_response_times.csv")
+        self.fence_user_info_reporter = self.FenceUserInfoResponseTimeReporter("fence_user_info_response_time.csv")
 
     class AbstractResponseTimeReporter(ABC):
+        # The CSV columns, which are fixed for each reporter
+        FIELDNAMES: Tuple[str, ...] = ()
+        # Rows are buffered and written together once the oldest buffered row is
+        # `max_pending_seconds` old, so the file stays reasonably current.
+        # With the 30 second monitoring interval, this writes every few rows.
+        max_pending_seconds = 60
+
         def __init__(self, output_filename):
             super().__init__()
             self.output_filename = output_filename
+            # The output file is opened on the first write and held open until close()
+            self._csvfile = None
+            self._writer = None
+            self._csv_lock = threading.Lock()
+            self._closed = False
+            self._pending_rows = []
+            self._oldest_pending_time = None
 
         @abstractmethod
         def measure_and_report(self):
             pass
 
+        def open(self) -> None:
+            with self._csv_lock:
+                self._open_csv()
+
+        def _open_csv(self) -> None:
+            # Write the complete header up front, so the output file has all the columns
+            # even if the first measurements are incomplete or none are ever written.
+            if self._writer is None:
+                output_filepath = self.get_output_filepath(self.output_filename)
+                write_header = False if Path(output_filepath).exists() else True
+                self._csvfile = open(output_filepath, 'a', newline='', buffering=8192)
+                self._writer = csv.DictWriter(self._csvfile, fieldnames=self.FIELDNAMES, extrasaction='ignore')
+                if write_header:
+                    self._writer.writeheader()
+                    self._csvfile.flush()
+
+        def write_monitoring_info_to_csv(self, monitoring_info_dict: dict) -> None:
+            # Start from an empty value for every column, so that operations which failed
+            # to complete still produce a row aligned with the header.
+            row_info = dict.fromkeys(self.FIELDNAMES)
+            row_info.update(self.flatten_monitoring_info_dict(monitoring_info_dict))
+            with self._csv_lock:
+                if self._closed:
+                    # A run that was still in progress when monitoring was stopped
+                    logger.warning(f"Discarding measurements made after {self.output_filename} was closed")
+                    return
+                if not self._pending_rows:
+                    self._oldest_pending_time = time.monotonic()
+                self._pending_rows.append(row_info)
+                if time.monotonic() - self._oldest_pending_time >= self.max_pending_seconds:
+                    self._write_pending_rows()
+
+        def _write_pending_rows(self) -> None:
+            self._open_csv()
+            self._writer.writerows(self._pending_rows)
+            self._csvfile.flush()
+            self._pending_rows.clear()
+
+        def close(self) -> None:
+            with self._csv_lock:
+                self._closed = True
+                if self._pending_rows:
+                    self._write_pending_rows()
+                if self._csvfile is not None:
+                    self._csvfile.close()
+                    self._csvfile = None
+                    self._writer = None
+
     class DrsFlowResponseTimeReporter(AbstractResponseTimeReporter, TerraMethods, Gen3Methods):
+        OPERATION_NAMES = ('indexd_get_metadata', 'bond_get_access_token', 'bond_get_sa_key', 'fence_get_signed_url')
+        FIELDNAMES = MonitoringUtilityMethods.get_csv_fieldnames(OPERATION_NAMES)
+
+        # Only the Fence signed URL request depends on a previous response (the Fence
+        # user token from Bond), so the independent requests are run concurrently.
+        # Note this pool is shared by all runs; if a run's requests stall, a later
+        # run's requests wait for a free worker (bounded by the request timeouts).
+        _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="DrsFlow")
+
         def __init__(self, output_filename):
             super().__init__(output_filename)
 
         def measure_response_times(self) -> dict:
             monitoring_infos = dict()
+            concurrent_operations = dict()
             try:
                 terra_user_token = self.get_terra_user_pet_sa_token()
 
                 # Get DRS metadata from Gen3 Indexd
-                drs_metadata, mon_info = self.get_gen3_drs_resolution()
-                monitoring_infos['indexd_get_metadata'] = mon_info
+                concurrent_operations['indexd_get_metadata'] = self._executor.submit(self.get_gen3_drs_resolution)
 
                 # Get service account key from Bond
-                sa_key, mon_info = self.get_service_account_key_from_bond(terra_user_token)
-                monitoring_infos['bond_get_sa_key'] = mon_info
+                concurrent_operations['bond_get_sa_key'] = \
+                    self._executor.submit(self.get_service_account_key_from_bond, terra_user_token)
 
                 # Get Fence user token from Bond
                 fence_user_token, mon_info = self.get_fence_token_from_bond(terra_user_token)
                 monitoring_infos['bond_get_access_token'] = mon_info
-                assert fence_user_token is not None, "Failed to get Fence user token."
 
                 # Get signed URL from Fence
-                access_url, mon_info = self.get_gen3_drs_access(fence_user_token)
-                monitoring_infos['fence_get_signed_url'] = mon_info
+                if fence_user_token is not None:
+                    access_url, mon_info = self.get_gen3_drs_access(fence_user_token)
+                    monitoring_infos['fence_get_signed_url'] = mon_info
+                else:
+                    logger.warning("Failed to get Fence user token.")
 
             except Exception as ex:
                 logger.warning(f"Exception occurred: {ex}")
 
+            finally:
+                # Record the concurrent measurements even if the sequential requests failed
+                for operation_name, future in concurrent_operations.items():
+                    try:
+                        result, monitoring_infos[operation_name] = future.result()
+                    except Exception as ex:
+                        logger.warning(f"Exception occurred: {ex}")
+
             return monitoring_infos
 
         def measure_and_report(self):
             monitoring_infos = self.measure_response_times()
-            self.write_monitoring_info_to_csv(monitoring_infos, self.output_filename)
+            self.write_monitoring_info_to_csv(monitoring_infos)
 
     class MarthaResponseTimeReporter(AbstractResponseTimeReporter, TerraMethods):
+        OPERATION_NAMES = ('martha',)
+        FIELDNAMES = MonitoringUtilityMethods.get_csv_fieldnames(OPERATION_NAMES)
+
         def __init__(self, output_filename):
             super().__init__(output_filename)
 
@@ -475,9 +612,12 @@ class ResponseTimeMonitor(Scheduler):
 
         def measure_and_report(self):
             monitoring_infos = self.measure_response_times()
-            self.write_monitoring_info_to_csv(monitoring_infos, self.output_filename)
+            self.write_monitoring_info_to_csv(monitoring_infos)
 
     class BondExternalIdentityResponseTimeReporter(AbstractResponseTimeReporter, TerraMethods):
+        OPERATION_NAMES = ('bond_get_link_url', 'bond_get_link_status')
+        FIELDNAMES = MonitoringUtilityMethods.get_csv_fieldnames(OPERATION_NAMES)
+
         def __init__(self, output_filename):
             super().__init__(output_filename)
 
@@ -497,9 +637,12 @@ class ResponseTimeMonitor(Scheduler):
 
         def measure_and_report(self):
             monitoring_infos = self.measure_response_times()
-            self.write_monitoring_info_to_csv(monitoring_infos, self.output_filename)
+            self.write_monitoring_info_to_csv(monitoring_infos)
 
     class FenceUserInfoResponseTimeReporter(AbstractResponseTimeReporter, TerraMethods, Gen3Methods):
+        OPERATION_NAMES = ('fence_user_info',)
+        FIELDNAMES = MonitoringUtilityMethods.get_csv_fieldnames(OPERATION_NAMES)
+
         def __init__(self, output_filename):
             super().__init__(output_filename)
 
@@ -517,38 +660,50 @@ class ResponseTimeMonitor(Scheduler):
 
         def measure_and_report(self):
             monitoring_infos = self.measure_response_times()
-            self.write_monitoring_info_to_csv(monitoring_infos, self.output_filename)
+            self.write_monitoring_info_to_csv(monitoring_infos)
 
     @catch_exceptions()
     def check_drs_flow_response_times(self):
-        output_filename = "drs_flow_response_times.csv"
-        reporter = self.DrsFlowResponseTimeReporter(output_filename)
-        reporter.measure_and_report()
+        self.drs_flow_reporter.measure_and_report()
 
     @catch_exceptions()
     def check_martha_response_time(self):
-        output_filename = "martha_response_time.csv"
-        reporter = self.MarthaResponseTimeReporter(output_filename)
-        reporter.measure_and_report()
+        self.martha_reporter.measure_and_report()
 
     @catch_exceptions()
     def check_bond_external_identity_response_times(self):
-        output_filename = "bond_external_idenity_response_times.csv"
-        reporter = self.BondExternalIdentityResponseTimeReporter(output_filename)
-        reporter.measure_and_report()
+        self.bond_external_identity_reporter.measure_and_report()
 
     @catch_exceptions()
     def check_fence_user_info_response_time(self):
-        output_filename = "fence_user_info_response_time.csv"
-        reporter = self.FenceUserInfoResponseTimeReporter(output_filename)
-        reporter.measure_and_report()
+        self.fence_user_info_reporter.measure_and_report()
 
     def configure_monitoring(self):
-        schedule.every(self.interval_seconds).seconds.do(super().run_threaded, self.check_drs_flow_response_times)
-        schedule.every(self.interval_seconds).seconds.do(super().run_threaded, self.check_martha_response_time)
-        schedule.every(self.interval_seconds).seconds.do(super().run_threaded,
-                                                         self.check_bond_external_identity_response_times)
-        schedule.every(self.interval_seconds).seconds.do(super().run_threaded, self.check_fence_user_info_response_time)
+        self._scheduler.every(self.interval_seconds).seconds.do(self.run_threaded, self.check_drs_flow_response_times)
+        self._scheduler.every(self.interval_seconds).seconds.do(self.run_threaded, self.check_martha_response_time)
+        self._scheduler.every(self.interval_seconds).seconds.do(self.run_threaded,
+                                                                self.check_bond_external_identity_response_times)
+        self._scheduler.every(self.interval_seconds).seconds.do(self.run_threaded, self.check_fence_user_info_response_time)
+
+    def get_reporters(self) -> list:
+        return [self.drs_flow_reporter, self.martha_reporter,
+                self.bond_external_identity_reporter, self.fence_user_info_reporter]
+
+    def start_monitoring(self):
+        for reporter in self.get_reporters():
+            reporter.open()
+        # Write any buffered rows if the process exits without stop_monitoring() being called
+        atexit.register(self.close_reporters)
+        super().start_monitoring()
+
+    def stop_monitoring(self):
+        super().stop_monitoring()
+        self.close_reporters()
+        atexit.unregister(self.close_reporters)
+
+    def close_reporters(self):
+        for reporter in self.get_reporters():
+            reporter.close()
 
 
 def configure_logging(output_directory_path: str) -> logging.Logger:
@@ -556,9 +711,8 @@ def configure_logging(output_directory_path: str) -> logging.Logger:
     logging.basicConfig(
         format='%(asctime)s %(levelname)-8s %(threadName)-12s %(message)s',
         datefmt='%Y/%m/%d %H:%M:%S',
-        filename=log_filename,
-        filemode="w",
-        level=logging.DEBUG)
+        handlers=[logging.FileHandler(log_filename, mode="w", delay=True)],
+        level=logging.INFO)
     logging.Formatter.converter = time.gmtime
     print(f"Logging to file: {log_filename}")
     return logging.getLogger()
@@ -574,6 +728,8 @@ def parse_arg_list(arg_list: list = None) -> argparse.Namespace:
     parser.add_argument('--output-dir', type=str, required=False,
                         default=f"./monitoring_output_{utc_timestamp}",
                         help="Directory to contain monitoring output files")
+    parser.add_argument('--duration-seconds', type=int, required=False, default=None,
+                        help="Stop monitoring after this many seconds. By default, monitoring runs until stopped.")
     args = parser.parse_args(arg_list)
     return args
 
@@ -603,7 +759,7 @@ def set_configuration(args: argparse.Namespace) -> None:
 responseTimeMonitor: ResponseTimeMonitor = None
 
 
-def main(arg_list: list = None) -> None:
+def main(arg_list: list = None, run_until_stopped: bool = False) -> None:
     args = parse_arg_list(arg_list)
     set_configuration(args)
 
@@ -613,6 +769,11 @@ def main(arg_list: list = None) -> None:
     responseTimeMonitor.configure_monitoring()
     responseTimeMonitor.start_monitoring()
 
+    if args.duration_seconds is not None or run_until_stopped:
+        # Run for the requested duration (if any), or until stopped sooner (e.g. by SIGTERM)
+        responseTimeMonitor.stop_run_continuously.wait(args.duration_seconds)
+        responseTimeMonitor.stop_monitoring()
+
 #
 # Start/Stop monitoring in the current (callers) process
 #
@@ -660,15 +821,21 @@ def stop_monitoring_background_process(process: psutil.Process) -> None:
     print("Stopped monitoring background process.")
 
 
-if __name__ == "__main__":
-    main()
+def _stop_monitoring_on_sigterm(signum, frame) -> None:
+    # Only signal the main thread to stop, which then calls stop_monitoring(),
+    # rather than stopping (and taking the reporters' locks) within the handler.
+    # The signal may arrive before main() has created and started the monitor,
+    # in which case there is no buffered output to write.
+    if responseTimeMonitor is not None and responseTimeMonitor.stop_run_continuously is not None:
+        responseTimeMonitor.stop_run_continuously.set()
+    else:
+        raise SystemExit(0)
 
-    # # Run for a while
-    # sleep_seconds = 90
-    # print(f"Sleeping for {sleep_seconds} ...")
-    # time.sleep(sleep_seconds)
-    # print("Done sleeping")
-    #
-    # # Stop monitoring
-    # responseTimeMonitor.stop_monitoring()
 
+if __name__ == "__main__":
+    # Stop monitoring when terminated by stop_monitoring_background_process(),
+    # so that any buffered output is written to the output files.
+    signal.signal(signal.SIGTERM, _stop_monitoring_on_sigterm)
+
+    # Keep the process running until monitoring is stopped
+    main(run_until_stopped=True)
@@ -0,0 +1,27 @@
+"""Terra User Authentication
+This module provides the access token of the current Terra user (the user's pet service account
+when run in Terra), shared by the response time monitoring and workflow status tools.
+The credentials are cached and only refreshed when the token is missing or close to expiring.
+"""
+
+from datetime import datetime, timedelta
+import threading
+
+import requests
+
+_token_refresh_margin = timedelta(seconds=300)
+_creds = None
+_creds_lock = threading.Lock()
+
+
+def get_terra_user_token(session: requests.Session = None) -> str:
+    import google.auth
+    import google.auth.transport.requests
+    global _creds
+    with _creds_lock:
+        if _creds is None:
+            _creds, projects = google.auth.default()
+        if not _creds.valid or \
+                (_creds.expiry is not None and _creds.expiry - datetime.utcnow() < _token_refresh_margin):
+            _creds.refresh(google.auth.transport.requests.Request(session=session))
+        return _creds.token
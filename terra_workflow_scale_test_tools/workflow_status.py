@@ -9,11 +9,18 @@ import time
 
 import requests
 
+from terra_workflow_scale_test_tools.terra_auth import get_terra_user_token
+
 
 class WorkflowDAO:
     """ Workflow information data access class
     """
 
+    # Minimum time between requests for the workflow information
+    min_refresh_interval_seconds = 10
+
+    in_process_statuses = frozenset(["Queued", "Submitted", "Running"])
+
     def __init__(self, terra_deployment_tier, workspace_namespace: str, workspace_name: str, wf_submission_id: str):
         self.terra_deployment_tier = terra_deployment_tier
         self.workspace_namespace = workspace_namespace
@@ -22,29 +29,51 @@ class WorkflowDAO:
         self.firecloud_api_url = \
             f"https://firecloud-orchestration.dsde-{self.terra_deployment_tier.lower()}.broadinstitute.org"
         self.workflow_info: dict = None
+        self._etag: str = None
+        self._last_update_time: float = None
+        self._submission_date: str = None
+        self._submission_datetime: datetime = None
 
-    @staticmethod
-    def _get_terra_user_token() -> str:
-        import google.auth.transport.requests
-        creds, projects = google.auth.default()
-        creds.refresh(google.auth.transport.requests.Request())
-        token = creds.token
-        return token
+    # Shared by all instances, so the connection to Terra is reused across updates
+    _session = requests.Session()
+
+    @classmethod
+    def _get_terra_user_token(cls) -> str:
+        return get_terra_user_token(cls._session)
 
-    # TODO Make this more efficient
     def update(self):
+        # Skip the request entirely if the information was refreshed very recently
+        if self._last_update_time is not None and \
+                time.monotonic() - self._last_update_time < self.min_refresh_interval_seconds:
+            return
+
         terra_user_token = self._get_terra_user_token()
 
         headers = {
             'authorization': f"Bearer {terra_user_token}",
             'content-type': "application/json"
         }
+        # Make a conditional request, so that an unchanged submission is not re-sent
+        if self._etag is not None and self.workflow_info is not None:
+            headers['if-none-match'] = self._etag
 
-        resp = requests.get(f"{self.firecloud_api_url}/api/workspaces/{self.workspace_namespace}/{self.workspace_name}/submissions/{self.wf_submission_id}",
-                            headers=headers)
+        resp = self._session.get(f"{self.firecloud_api_url}/api/workspaces/{self.workspace_namespace}/{self.workspace_name}/submissions/{self.wf_submission_id}",
+                                 headers=headers)
         # print(f"Request URL: {resp.request.url}")  # Debugging
         resp.raise_for_status()
+        self._last_update_time = time.monotonic()
+        if resp.status_code == 304:  # Not Modified
+            return
         self.workflow_info = resp.json() if resp.ok else None
+        self._etag = resp.headers.get('ETag')
+
+        # Parse the submission date only when it changes, as it is constant for a submission
+        submission_date = self.workflow_info['submissionDate']
+        if submission_date != self._submission_date:
+            # Convert submissionDate format to the specific ISO format supported by `fromisoformat`
+            iso_submission_date = submission_date.replace('Z', '+00:00')
+            self._submission_datetime = datetime.fromisoformat(iso_submission_date)
+            self._submission_date = submission_date
 
     def get_workflow_info(self) -> dict:
         if self.workflow_info is None:
@@ -55,15 +84,12 @@ class WorkflowDAO:
         return self.get_workflow_info()['status']
 
     def is_in_process(self) -> bool:
-        in_process_status_list = ["Queued", "Submitted", "Running"]
-        return self.get_workflow_info()['status'] in in_process_status_list
+        return self.get_submission_status() in self.in_process_statuses
 
     def get_submission_time(self, strftime_format_string: str = None):
         submission_date = self.get_workflow_info()['submissionDate']
         if strftime_format_string is not None:
-            # Convert submissionDate format to the specific ISO format supported by `fromisoformat`
-            iso_submission_date = submission_date.replace('Z', '+00:00')
-            return datetime.fromisoformat(iso_submission_date).strftime(strftime_format_string)
+            return self._submission_datetime.strftime(strftime_format_string)
         else:
             return submission_date
 
@@ -87,26 +113,30 @@ class WorkflowDAO:
         return self.get_workflow_info()['userComment']
 
     def get_workflow_summary_display_string(self) -> str:
-        return "\n".join([f"Method Configuration: {self.get_method_configuration_display_name()}",
-                          f"Submitter: {self.get_submitter()}",
+        info = self.get_workflow_info()
+        submission_entity = info['submissionEntity']
+        return "\n".join([f"Method Configuration: {info['methodConfigurationNamespace']}/{info['methodConfigurationName']}",
+                          f"Submitter: {info['submitter']}",
                           # TODO Display in in Eastern and Pacific time also
-                          f"Submitted: {self.get_submission_time('%Y/%m/%d %H:%M:%S')} UTC",
-                          f"Submission Id: {self.get_submission_id()}",
-                          f"Submission Entity: {self.get_submission_entity_display_name()}",
-                          f"Use Call Cache: {self.get_use_call_cache()}",
-                          f"Submission Status: {self.get_submission_status()}",
-                          f"User Comment: {self.get_user_comment()}"])
+                          f"Submitted: {self._submission_datetime.strftime('%Y/%m/%d %H:%M:%S')} UTC",
+                          f"Submission Id: {info['submissionId']}",
+                          f"Submission Entity: {submission_entity['entityType']}:{submission_entity['entityName']}",
+                          f"Use Call Cache: {info['useCallCache']}",
+                          f"Submission Status: {info['status']}",
+                          f"User Comment: {info['userComment']}"])
 
 
 def wait_for_workflow_to_complete(workflow_dao: WorkflowDAO) -> None:
     sleep_seconds = 30
-    while workflow_dao.is_in_process():
-        print(f"Submission status: {workflow_dao.get_submission_status()}")
+    status = workflow_dao.get_submission_status()
+    while status in WorkflowDAO.in_process_statuses:
+        print(f"Submission status: {status}")
         print(f"Sleeping for {sleep_seconds} seconds ...")
         time.sleep(sleep_seconds)
         print("Getting current submission status ... ")
         workflow_dao.update()
-    print(f"Final Submission status: {workflow_dao.get_submission_status()}")
+        status = workflow_dao.get_submission_status()
+    print(f"Final Submission status: {status}")
 
 
 if __name__ == "__main__":